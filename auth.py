@@ -1,6 +1,12 @@
-from datetime import datetime, timedelta
-from jose import jwt, JWTError
-from passlib.context import CryptContext
+from datetime import datetime, timezone
+import jwt
+from jwt import InvalidTokenError
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import bcrypt
+import hashlib
+import hmac
+import orjson
 import secrets
 import os
 from fastapi import HTTPException, status, Request, Depends
@@ -10,8 +16,13 @@ from database import get_db
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from model import Employee
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+from cachetools import TLRUCache, TTLCache
+from redis.exceptions import RedisError
+from cache import redis_client, redis_stream_client
 import asyncio
+import time
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-strong-secret-key")
@@ -21,22 +32,64 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 15  # Shorter for better security
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 TEMP_TOKEN_EXPIRE_MINUTES = 5
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def _error_body(code: int, detail: str) -> dict:
+    # The import-time timestamp would be meaningless on a shared body, so it is left out
+    return ErrorResponse(code=code, detail=detail).model_dump(mode="json", exclude={"timestamp"})
 
-# Token storage
-temp_token_store: Dict[str, dict] = {}
-active_tokens: Dict[str, dict] = {}  # Store active tokens for quick revocation
+# Prebuilt error bodies for the auth failure paths
+ERR_UNAUTHORIZED = _error_body(401, "Unauthorized")
+ERR_INVALID_CREDENTIALS = _error_body(401, "Invalid credentials")
+ERR_INVALID_TEMP_TOKEN = _error_body(401, "Invalid or expired temporary token")
+ERR_MISSING_TOKEN = _error_body(401, "Missing access token")
+ERR_EXPIRED_CREDENTIALS = _error_body(401, "Invalid or expired credentials")
+ERR_INSUFFICIENT_PERMISSIONS = _error_body(403, "Insufficient permissions")
+
+# Every token shares the same header, so its encoded form is computed once
+JWT_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+
+# Password hashing (bcrypt releases the GIL, so a thread pool scales with cores)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Token revocation: Redis is the source of truth, every worker keeps a local mirror
+REVOKED_JTI_KEY = "revoked_jti"  # ZSET of jti scored by exp
+REVOKED_EVENTS_STREAM = "revoked_events"  # Propagates revocations to all workers
+REVOKED_EVENTS_MAXLEN = 100_000
+
+# Token storage (entries expire lazily on access, no janitor task needed)
+temp_token_store: TTLCache = TTLCache(
+    maxsize=100_000, ttl=TEMP_TOKEN_EXPIRE_MINUTES * 60
+)
+# jti -> exp, checked on every verification; each entry lives until its token's exp
+revoked_jtis: TLRUCache = TLRUCache(
+    maxsize=1_000_000, ttu=lambda _jti, exp, _now: exp, timer=time.time
+)
+
+# Bounded LRU of verified access tokens: token -> (exp, ip, jti, TokenData)
+VERIFIED_TOKEN_CACHE_SIZE = 10_000
+verified_token_cache: "OrderedDict[str, Tuple[int, str, str, TokenData]]" = OrderedDict()
 
 class AuthService:
     def __init__(self):
-        self.temp_token_expiry = timedelta(minutes=TEMP_TOKEN_EXPIRE_MINUTES)
-        self.refresh_token_expiry = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        # Token lifetimes in seconds; all expiry math uses integer Unix timestamps
+        self.temp_token_expiry = TEMP_TOKEN_EXPIRE_MINUTES * 60
+        self.access_token_expiry = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        self.refresh_token_expiry = REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        self._bcrypt_pool = ThreadPoolExecutor(
+            max_workers=os.cpu_count(),
+            thread_name_prefix="bcrypt"
+        )
+        # Encode the HMAC keys once instead of on every sign/verify
+        self._access_key = SECRET_KEY.encode()
+        self._refresh_key = REFRESH_SECRET_KEY.encode()
+        # Keyed HMAC states; copying one skips re-deriving the inner/outer pads
+        self._access_signer = hmac.new(self._access_key, digestmod=hashlib.sha256)
+        self._refresh_signer = hmac.new(self._refresh_key, digestmod=hashlib.sha256)
         
     def create_temp_token(self, client_ip: str) -> TempToken:
         """Generate IP-based temporary token"""
-        token = secrets.token_urlsafe(32)
-        expires_at = datetime.utcnow() + self.temp_token_expiry
+        # 24 random bytes (192 bits) encode to exactly 32 chars, so no padding to strip
+        token = base64.urlsafe_b64encode(os.urandom(24)).decode("ascii")
+        expires_at = int(time.time()) + self.temp_token_expiry
 
         temp_token_store[token] = {
             "expires_at": expires_at,
@@ -44,8 +97,10 @@ class AuthService:
             "ip": client_ip
         }
 
-        # Convert expires_at to ISO string for JSON serialization
-        return TempToken(temp_token=token, expires_at=expires_at.isoformat())
+        return TempToken(
+            temp_token=token,
+            expires_at=datetime.fromtimestamp(expires_at, timezone.utc)
+        )
     
     def verify_temp_token(self, token: str, client_ip: str) -> bool:
         """Verify temporary token with IP validation"""
@@ -54,7 +109,7 @@ class AuthService:
         if not token_data:
             return False
         
-        if datetime.utcnow() > token_data["expires_at"]:
+        if int(time.time()) > token_data["expires_at"]:
             return False
         
         if token_data["used"]:
@@ -73,117 +128,135 @@ class AuthService:
     
     def create_access_token(self, token_data: TokenData, client_ip: str) -> str:
         """Create IP-bound JWT access token"""
-        exp = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        payload = token_data.model_dump()
-        payload.update({
-            "exp": int(exp.timestamp()),  # Store as integer timestamp
-            "ip": client_ip,
-            "type": "access"
-        })
-        token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
-        
-        # Store token in memory
-        active_tokens[token] = {
-            "empid": token_data.empid,
+        payload = {
+            **token_data._payload_base,
+            "exp": int(time.time()) + self.access_token_expiry,
             "ip": client_ip,
-            "exp": int(exp.timestamp()),  # Store as integer timestamp
-            "created_at": datetime.utcnow()
+            "type": "access",
+            "jti": secrets.token_hex(8)
         }
-        
-        return token
+        return self._sign_token(payload, self._access_signer)
     
     def create_refresh_token(self, token_data: TokenData, client_ip: str) -> str:
         """Create IP-bound refresh token"""
-        payload = token_data.model_dump()
-        payload.update({
-            "exp": datetime.utcnow() + self.refresh_token_expiry,
+        payload = {
+            **token_data._payload_base,
+            "exp": int(time.time()) + self.refresh_token_expiry,
             "ip": client_ip,
-            "type": "refresh"
-        })
-        token = jwt.encode(payload, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
-        
-        # Store refresh token in memory
-        active_tokens[token] = {
-            "empid": token_data.empid,
-            "ip": client_ip,
-            "exp": payload["exp"],
-            "created_at": datetime.utcnow()
+            "type": "refresh",
+            "jti": secrets.token_hex(8)
         }
-        
-        return token
+        return self._sign_token(payload, self._refresh_signer)
+    
+    def _sign_token(self, payload: dict, signer) -> str:
+        """Encode an HS256 JWT using the precomputed header and keyed HMAC"""
+        body = base64.urlsafe_b64encode(orjson.dumps(payload)).rstrip(b"=")
+        signing_input = JWT_HEADER_B64 + b"." + body
+        mac = signer.copy()
+        mac.update(signing_input)
+        signature = base64.urlsafe_b64encode(mac.digest()).rstrip(b"=")
+        return (signing_input + b"." + signature).decode("ascii")
     
     def verify_access_token(self, token: str, client_ip: str) -> TokenData:
         """Verify access token with strict IP binding"""
-        # First check if token exists in active tokens
-        if token not in active_tokens:
-            raise JWTError("Token not found or revoked")
-            
+        # Tokens are immutable, so a previously verified one only needs its
+        # expiry, IP binding and revocation status re-checked
+        cached = verified_token_cache.get(token)
+        if cached is not None:
+            exp, ip, jti, token_data = cached
+            if ip == client_ip and jti not in revoked_jtis and time.time() < exp:
+                verified_token_cache.move_to_end(token)
+                return token_data
+        
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            payload = jwt.decode(token, self._access_key, algorithms=[ALGORITHM])
             self._validate_token_payload(payload, client_ip, "access")
-            return TokenData(**{k: v for k, v in payload.items() if k in TokenData.__annotations__})
-        except JWTError as e:
+            token_data = self._token_data_from_payload(payload)
+        except InvalidTokenError as e:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=ErrorResponse(
-                    code=401,
-                    detail=f"Invalid token: {str(e)}"
-                ).dict()
+                detail={**ERR_UNAUTHORIZED, "detail": f"Invalid token: {e}"}
             )
+        
+        verified_token_cache[token] = (payload["exp"], client_ip, payload["jti"], token_data)
+        if len(verified_token_cache) > VERIFIED_TOKEN_CACHE_SIZE:
+            verified_token_cache.popitem(last=False)
+        return token_data
     
     def verify_refresh_token(self, token: str, client_ip: str) -> TokenData:
         """Verify refresh token with strict IP binding"""
-        # First check if token exists in active tokens
-        if token not in active_tokens:
-            raise JWTError("Token not found or revoked")
-            
         try:
-            payload = jwt.decode(token, REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
+            payload = jwt.decode(token, self._refresh_key, algorithms=[ALGORITHM])
             self._validate_token_payload(payload, client_ip, "refresh")
-            return TokenData(**{k: v for k, v in payload.items() if k in TokenData.__annotations__})
-        except JWTError as e:
+            return self._token_data_from_payload(payload)
+        except InvalidTokenError as e:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=ErrorResponse(
-                    code=401,
-                    detail=f"Invalid refresh token: {str(e)}"
-                ).dict()
+                detail={**ERR_UNAUTHORIZED, "detail": f"Invalid refresh token: {e}"}
             )
     
+    def _token_data_from_payload(self, payload: dict) -> TokenData:
+        return TokenData(username=payload["sub"], role=payload["role"], empid=payload["empid"])
+    
     def _validate_token_payload(self, payload: dict, client_ip: str, token_type: str):
         """Validate token payload with strict checks"""
         if payload.get("type") != token_type:
-            raise JWTError("Invalid token type")
+            raise InvalidTokenError("Invalid token type")
         
-        if datetime.utcnow() > datetime.fromtimestamp(payload["exp"]):
-            raise JWTError("Token expired")
+        if int(time.time()) > payload["exp"]:
+            raise InvalidTokenError("Token expired")
         
         if payload.get("ip") != client_ip:
-            raise JWTError("IP address changed")
+            raise InvalidTokenError("IP address changed")
         
         # Validate required claims
-        required_claims = ["sub", "role", "empid"]
+        required_claims = ["sub", "role", "empid", "jti"]
         if not all(claim in payload for claim in required_claims):
-            raise JWTError("Missing required claims")
+            raise InvalidTokenError("Missing required claims")
+        
+        # Local set lookup only, kept in sync by consume_revocations
+        if payload["jti"] in revoked_jtis:
+            raise InvalidTokenError("Token revoked")
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+        return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
     
     def get_password_hash(self, password: str) -> str:
-        return pwd_context.hash(password)
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
+    
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password on the bcrypt pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._bcrypt_pool, self.verify_password, plain_password, hashed_password
+        )
+    
+    async def get_password_hash_async(self, password: str) -> str:
+        """Hash a password on the bcrypt pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._bcrypt_pool, self.get_password_hash, password)
     
     async def authenticate_user(self, db: AsyncSession, username: str, password: str) -> TokenData:
-        stmt = select(Employee).where(Employee.username == username)
+        # Plain columns only: no ORM identity or relationship loader setup
+        stmt = select(
+            Employee.empid,
+            Employee.username,
+            Employee.role,
+            Employee.password_hash,
+            Employee.is_active
+        ).where(Employee.username == username)
         result = await db.execute(stmt)
-        user = result.scalars().first()
+        user = result.first()
         
-        if not user or not self.verify_password(password, user.password_hash):
+        # Disabled accounts are rejected before paying for bcrypt
+        if (
+            not user
+            or not user.is_active
+            or not await self.verify_password_async(password, user.password_hash)
+        ):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=ErrorResponse(
-                    code=401,
-                    detail="Invalid credentials"
-                ).dict()
+                detail=ERR_INVALID_CREDENTIALS
             )
             
         return TokenData(
@@ -198,12 +271,9 @@ class AuthService:
         if not self.verify_temp_token(login_data.temp_token, client_ip):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=ErrorResponse(
-                    code=401,
-                    detail="Invalid or expired temporary token"
-                ).dict()
+                detail=ERR_INVALID_TEMP_TOKEN
             )
-        print("Temp token verified")
+        
         # Authenticate credentials
         token_data = await self.authenticate_user(db, login_data.username, login_data.password)
         
@@ -253,42 +323,73 @@ class AuthService:
             max_age=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
         )
     
-    async def cleanup_expired_tokens(self):
-        """Periodically clean expired tokens"""
-        while True:
-            now = datetime.utcnow()
-            
-            # Clean temp tokens
-            expired_temp = [k for k, v in temp_token_store.items() 
-                          if v["expires_at"] < now]
-            for token in expired_temp:
-                del temp_token_store[token]
-            
-            # Clean active tokens
-            expired_active = [k for k, v in active_tokens.items() 
-                            if datetime.fromtimestamp(v["exp"]) < now]
-            for token in expired_active:
-                del active_tokens[token]
-            
-            await asyncio.sleep(60 * 5)  # Run every 5 minutes
-
-    def revoke_token(self, token: str):
+    async def revoke_token(self, token: str) -> bool:
         """Revoke a token before expiration"""
-        if token in active_tokens:
-            del active_tokens[token]
-            return True
-        return False
+        verified_token_cache.pop(token, None)
+        try:
+            claims = jwt.decode(token, options={"verify_signature": False})
+        except InvalidTokenError:
+            return False
+        
+        jti, exp = claims.get("jti"), claims.get("exp")
+        if not jti or not exp:
+            return False
+        
+        revoked_jtis[jti] = exp
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                # Trim revocations of already-expired tokens as part of the same round trip
+                pipe.zremrangebyscore(REVOKED_JTI_KEY, "-inf", int(time.time()))
+                pipe.zadd(REVOKED_JTI_KEY, {jti: exp})
+                pipe.xadd(
+                    REVOKED_EVENTS_STREAM,
+                    {"jti": jti, "exp": exp},
+                    maxlen=REVOKED_EVENTS_MAXLEN,
+                    approximate=True
+                )
+                await pipe.execute()
+        except RedisError:
+            # Still revoked in this worker; it just isn't broadcast to the others
+            pass
+        return True
+
+    async def consume_revocations(self):
+        """Mirror revocations published by any worker into the local set"""
+        last_id = None
+        while True:
+            try:
+                if last_id is None:
+                    # Remember the stream position first so nothing is missed while warming
+                    latest = await redis_stream_client.xrevrange(REVOKED_EVENTS_STREAM, count=1)
+                    last_id = latest[0][0] if latest else "0-0"
+                    revoked = await redis_stream_client.zrangebyscore(
+                        REVOKED_JTI_KEY, int(time.time()), "+inf", withscores=True
+                    )
+                    for jti, exp in revoked:
+                        revoked_jtis[jti] = int(exp)
+                
+                streams = await redis_stream_client.xread({REVOKED_EVENTS_STREAM: last_id}, block=0)
+                for _, events in streams:
+                    for event_id, fields in events:
+                        revoked_jtis[fields["jti"]] = int(fields["exp"])
+                        last_id = event_id
+            except RedisError:
+                # Resync from the ZSET once Redis is reachable again
+                last_id = None
+                await asyncio.sleep(5)
 
     async def get_current_user(self, request: Request) -> TokenData:
         """Dependency to get current user from verified token"""
+        # Already verified by security_middleware for this request
+        token_data = getattr(request.state, "token_data", None)
+        if token_data is not None:
+            return token_data
+        
         token = request.cookies.get("access_token")
         if not token:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=ErrorResponse(
-                    code=401,
-                    detail="Missing access token"
-                ).dict()
+                detail=ERR_MISSING_TOKEN
             )
         
         try:
@@ -307,10 +408,7 @@ class AuthService:
             
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=ErrorResponse(
-                    code=401,
-                    detail="Invalid or expired credentials"
-                ).dict()
+                detail=ERR_EXPIRED_CREDENTIALS
             )
 
     def require_role(self, required_role: str):
@@ -321,10 +419,7 @@ class AuthService:
             if current_user.role != required_role:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
-                    detail=ErrorResponse(
-                        code=403,
-                        detail="Insufficient permissions"
-                    ).dict()
+                    detail=ERR_INSUFFICIENT_PERMISSIONS
                 )
             return current_user
         return role_checker
@@ -0,0 +1,64 @@
+import os
+import orjson
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))  # seconds
+
+# Shared async Redis client (connection pool is per-process). Short timeouts so a
+# stalled Redis degrades to a cache miss instead of hanging the request.
+redis_client = aioredis.from_url(
+    REDIS_URL,
+    decode_responses=True,
+    socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT
+)
+
+# Separate client for blocking stream reads (XREAD BLOCK 0), which must not be
+# cut off by a socket timeout
+redis_stream_client = aioredis.from_url(
+    REDIS_URL,
+    decode_responses=True,
+    socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_keepalive=True
+)
+
+# Cache namespaces; keys are "<namespace>:..." so a whole namespace can be dropped
+EMPLOYEE_CACHE_NAMESPACE = "employees"
+
+def _index_key(namespace: str) -> str:
+    """SET holding every cached key in namespace"""
+    return f"{namespace}:keys"
+
+# Read-through response cache; Redis being unavailable only means a cache miss
+async def cache_get(key: str):
+    """Return the cached JSON value for key, or None on a miss"""
+    try:
+        raw = await redis_client.get(key)
+    except RedisError:
+        return None
+    return orjson.loads(raw) if raw is not None else None
+
+async def cache_set(key: str, value, ttl: int):
+    """Store a JSON-serializable value under key for ttl seconds"""
+    index_key = _index_key(key.split(":", 1)[0])
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(key, orjson.dumps(value), ex=ttl)
+            # Track the key so cache_clear never has to SCAN the keyspace
+            pipe.sadd(index_key, key)
+            pipe.expire(index_key, ttl)
+            await pipe.execute()
+    except RedisError:
+        pass
+
+async def cache_clear(namespace: str):
+    """Drop every cached entry under namespace"""
+    index_key = _index_key(namespace)
+    try:
+        keys = await redis_client.smembers(index_key)
+        await redis_client.delete(index_key, *keys)
+    except RedisError:
+        pass
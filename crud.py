@@ -1,64 +1,82 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from auth import get_password_hash
-from . import models, schemas
+from auth import auth_service
+import model as models
+import schemas
 
 # Employee CRUD
-def get_employee(db: Session, empid: int):
-    return db.query(models.Employee).filter(models.Employee.empid == empid).first()
+async def get_employee(db: AsyncSession, empid: int):
+    return await db.scalar(select(models.Employee).where(models.Employee.empid == empid))
 
-def get_employee_by_username(db: Session, username: str):
-    return db.query(models.Employee).filter(models.Employee.username == username).first()
+async def get_employee_by_username(db: AsyncSession, username: str):
+    return await db.scalar(select(models.Employee).where(models.Employee.username == username))
 
-def get_employees(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Employee).offset(skip).limit(limit).all()
+async def get_employees(db: AsyncSession, skip: int = 0, limit: int = 100):
+    # Eager-load relationships in two extra queries instead of one per employee
+    stmt = (
+        select(models.Employee)
+        .offset(skip)
+        .limit(limit)
+        .options(selectinload(models.Employee.leaves), selectinload(models.Employee.timesheets))
+    )
+    return (await db.scalars(stmt)).all()
 
-def create_employee(db: Session, employee: schemas.EmployeeCreate):
-    hashed_password = get_password_hash(employee.password)
+async def create_employee(db: AsyncSession, employee: schemas.EmployeeCreate):
+    hashed_password = await auth_service.get_password_hash_async(employee.password)
     db_employee = models.Employee(
         firstname=employee.firstname,
         lastname=employee.lastname,
         mail=employee.mail,
         username=employee.username,
         password_hash=hashed_password,
-        role=employee.role
+        role=employee.role,
+        is_active=True,
+        leaves_available=employee.leaves_available
     )
     db.add(db_employee)
-    db.commit()
-    db.refresh(db_employee)
+    await db.commit()
+    await db.refresh(db_employee)
     return db_employee
 
-def update_employee(db: Session, empid: int, employee: schemas.EmployeeUpdate):
-    db_employee = get_employee(db, empid)
+async def update_employee(db: AsyncSession, empid: int, employee: schemas.EmployeeUpdate):
+    db_employee = await get_employee(db, empid)
     if not db_employee:
         return None
-    
-    update_data = employee.dict(exclude_unset=True)
+
+    update_data = employee.model_dump(exclude_unset=True, exclude_none=True)
+    # password is not a column; hash it into password_hash like the router does
+    password = update_data.pop("password", None)
+    if password:
+        update_data["password_hash"] = await auth_service.get_password_hash_async(password)
     for key, value in update_data.items():
         setattr(db_employee, key, value)
-    
-    db.commit()
-    db.refresh(db_employee)
+
+    await db.commit()
+    await db.refresh(db_employee)
     return db_employee
 
 # Leave CRUD
-def create_leave(db: Session, leave: schemas.LeaveCreate, empid: int):
-    db_leave = models.Leave(**leave.dict(), empid=empid)
+async def create_leave(db: AsyncSession, leave: schemas.LeaveCreate, empid: int):
+    db_leave = models.Leave(**leave.model_dump(), empid=empid)
     db.add(db_leave)
-    db.commit()
-    db.refresh(db_leave)
+    await db.commit()
+    await db.refresh(db_leave)
     return db_leave
 
-def get_leaves(db: Session, empid: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Leave).filter(models.Leave.empid == empid).offset(skip).limit(limit).all()
+async def get_leaves(db: AsyncSession, empid: int, skip: int = 0, limit: int = 100):
+    stmt = select(models.Leave).where(models.Leave.empid == empid).offset(skip).limit(limit)
+    return (await db.scalars(stmt)).all()
 
 # Timesheet CRUD
-def create_timesheet(db: Session, timesheet: schemas.TimesheetCreate, empid: int):
-    db_timesheet = models.Timesheet(**timesheet.dict(), empid=empid)
+async def create_timesheet(db: AsyncSession, timesheet: schemas.TimesheetCreate, empid: int):
+    db_timesheet = models.Timesheet(**timesheet.model_dump(), empid=empid)
     db.add(db_timesheet)
-    db.commit()
-    db.refresh(db_timesheet)
+    await db.commit()
+    await db.refresh(db_timesheet)
     return db_timesheet
 
-def get_timesheets(db: Session, empid: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Timesheet).filter(models.Timesheet.empid == empid).offset(skip).limit(limit).all()
\ No newline at end of file
+async def get_timesheets(db: AsyncSession, empid: int, skip: int = 0, limit: int = 100):
+    stmt = select(models.Timesheet).where(models.Timesheet.empid == empid).offset(skip).limit(limit)
+    return (await db.scalars(stmt)).all()
@@ -1,12 +1,15 @@
 from fastapi import FastAPI, Request, Depends, HTTPException,Form
-from fastapi.responses import RedirectResponse, HTMLResponse, FileResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from auth import auth_service
 from database import get_db, engine, Base
+from cache import redis_client, redis_stream_client, REDIS_URL
 from routers import employees, leaves, timesheets
 from schemas import LoginRequest, Token, RefreshRequest
-from sqlalchemy.orm import Session
+from sqlalchemy import literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from model import Employee
 import os
 import asyncio
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -14,17 +17,46 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from pathlib import Path
+from cachetools import TTLCache
 from datetime import datetime, timedelta
-import random
-import string
+import hmac
+import re
+import secrets
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
-app = FastAPI()
+# Only honour X-Forwarded-For when running behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR") == "1"
+# Number of trusted proxies in front of the app; each appends one address
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+def get_client_address(request: Request) -> str:
+    """Rate limit key: the original client when behind a trusted proxy"""
+    if TRUST_FORWARDED_FOR:
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            # Entries left of what our proxies appended are client-controlled,
+            # so count from the right
+            hops = [hop.strip() for hop in forwarded_for.split(",")]
+            if len(hops) >= TRUSTED_PROXY_HOPS:
+                return hops[-TRUSTED_PROXY_HOPS]
+    return get_remote_address(request)
+
+# Initialize rate limiter (Redis-backed so limits hold across all workers;
+# falls back to per-process counters while Redis is unreachable)
+limiter = Limiter(
+    key_func=get_client_address,
+    storage_uri=REDIS_URL,
+    strategy="fixed-window",
+    in_memory_fallback_enabled=True
+)
+app = FastAPI(default_response_class=ORJSONResponse)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.add_middleware(SlowAPIMiddleware)
-password_reset_data = {}
+password_reset_data = TTLCache(maxsize=10_000, ttl=600)  # OTPs live for 10 minutes
+MAX_OTP_ATTEMPTS = 5  # wrong guesses before an issued OTP is thrown away
+# Password reset OTP delivery: set to an async callable (email, otp), e.g. an
+# SMTP or SMS sender. While unset, password reset is disabled and no OTPs are issued.
+app.state.otp_sender = None
 # Setup templates and static files
 BASE_DIR = Path(__file__).resolve().parent
 app.mount("/static", StaticFiles(directory=BASE_DIR / "app" / "static"), name="static")
@@ -34,16 +66,36 @@ templates = Jinja2Templates(directory=BASE_DIR / "app" / "templates")
 async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    asyncio.create_task(auth_service.cleanup_expired_tokens())
+    # Keep a strong reference; the loop only holds tasks weakly
+    app.state.revocation_task = asyncio.create_task(auth_service.consume_revocations())
+
+@app.on_event("shutdown")
+async def shutdown():
+    task = app.state.revocation_task
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await redis_client.close()
+    await redis_stream_client.close()
 
 # Public endpoints
-PUBLIC_PATHS = ["/", "/login", "/auth/login", "/auth/refresh", "/static"]
+PUBLIC_PATHS = [
+    "/", "/login", "/auth/login", "/auth/refresh", "/static",
+    "/forgot-password", "/auth/forgot-password"
+]
+# Single compiled matcher: "/" only matches itself; any other public path
+# matches itself or anything below it
+_PUBLIC_PATH_RE = re.compile(
+    "(?:/|(?:%s)(?:/.*)?)" % "|".join(re.escape(path) for path in PUBLIC_PATHS if path != "/")
+)
 
 @app.middleware("http")
 async def security_middleware(request: Request, call_next):
     """Enhanced security middleware with IP binding"""
     # Skip security for public paths
-    if any(request.url.path.startswith(path) for path in PUBLIC_PATHS):
+    if _PUBLIC_PATH_RE.fullmatch(request.url.path):
         return await call_next(request)
     
     # Extract token from cookies
@@ -54,7 +106,8 @@ async def security_middleware(request: Request, call_next):
         try:
             # Verify token with IP binding
             token_data = auth_service.verify_access_token(token, client_ip)
-            request.state.user = token_data
+            # Reused by get_current_user so the token is verified once per request
+            request.state.token_data = token_data
             
             # Set security headers
             response = await call_next(request)
@@ -77,7 +130,9 @@ async def security_middleware(request: Request, call_next):
     
     # Redirect to login with new temp token
     temp_token = auth_service.create_temp_token(client_ip)
-    redirect_url = request.url_for("login_page").include_query_params(
+    # Middleware runs before routing, so resolve the URL through the app
+    login_url = request.app.url_path_for("login_page").make_absolute_url(request.base_url)
+    redirect_url = login_url.include_query_params(
         temp_token=temp_token.temp_token,
         next=str(request.url)
     )
@@ -108,11 +163,11 @@ async def redirect_to_login():
 async def login_endpoint(
     login_data: LoginRequest,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Login endpoint with IP validation"""
     client_ip = request.client.host
-    token = auth_service.login(login_data, db, client_ip)
+    token = await auth_service.login(login_data, db, client_ip)
     
     # Set secure cookies
     response = RedirectResponse(url=request.query_params.get("next", "/dashboard"), status_code=303)
@@ -127,39 +182,75 @@ async def forgot_password_page(request: Request):
         {"request": request}
     )
 
+def _check_reset_otp(email: str, stored_data: dict, otp: str) -> bool:
+    """Compare otp with the issued one, discarding it after MAX_OTP_ATTEMPTS misses"""
+    # Constant-time comparison; bytes so non-ASCII input cannot raise
+    if hmac.compare_digest(stored_data["otp"].encode(), otp.encode()):
+        return True
+    stored_data["attempts"] += 1
+    if stored_data["attempts"] >= MAX_OTP_ATTEMPTS:
+        password_reset_data.pop(email, None)
+    return False
+
 @app.post("/auth/forgot-password")
+@limiter.limit("5/minute")
 async def handle_password_reset(
     request: Request,
     email: str = Form(...),
     otp: str = Form(None),
     new_password: str = Form(None),
     confirm_password: str = Form(None),
-    db: Session = Depends(get_db)  # Now using the imported Session
+    db: AsyncSession = Depends(get_db)
 ):
     """Handle the entire password reset flow in one endpoint"""
     client_ip = request.client.host
     
-    # Step 1: Initial request (generate and store OTP)
+    # Step 1: Initial request (generate, store and deliver OTP)
     if not otp and not new_password:
-        # Generate 6-digit OTP
-        reset_otp = ''.join(random.choices(string.digits, k=6))
-        
-        # Store OTP with expiration (10 minutes)
-        password_reset_data[email] = {
-            "otp": reset_otp,
-            "expires_at": datetime.utcnow() + timedelta(minutes=10),
-            "ip": client_ip
-        }
+        otp_sender = request.app.state.otp_sender
+        if otp_sender is None:
+            return templates.TemplateResponse(
+                "forgot_password.html",
+                {
+                    "request": request,
+                    "error": "Password reset is not available. Please contact an administrator."
+                }
+            )
         
-        print(f"OTP for {email}: {reset_otp}")  # For local testing
+        # Only send codes to real accounts, but answer the same either way
+        account_exists = await db.scalar(
+            select(literal(1)).where(Employee.mail == email).limit(1)
+        )
+        if account_exists:
+            # Generate 6-digit OTP
+            reset_otp = f"{secrets.randbelow(1_000_000):06d}"
+            
+            # Store OTP with expiration (10 minutes)
+            password_reset_data[email] = {
+                "otp": reset_otp,
+                "expires_at": datetime.utcnow() + timedelta(minutes=10),
+                "ip": client_ip,
+                "attempts": 0
+            }
+            
+            try:
+                await otp_sender(email, reset_otp)
+            except Exception:
+                password_reset_data.pop(email, None)
+                return templates.TemplateResponse(
+                    "forgot_password.html",
+                    {
+                        "request": request,
+                        "error": "Could not send the verification code. Please try again later."
+                    }
+                )
         
         return templates.TemplateResponse(
             "forgot_password.html",
             {
                 "request": request,
                 "email": email,
-                "show_otp": True,
-                "message": f"OTP sent to {email} (check console for local testing)"
+                "show_otp": True
             }
         )
     
@@ -190,7 +281,7 @@ async def handle_password_reset(
                 }
             )
         
-        if stored_data["otp"] != otp:
+        if not _check_reset_otp(email, stored_data, otp):
             return templates.TemplateResponse(
                 "forgot_password.html",
                 {
@@ -228,8 +319,21 @@ async def handle_password_reset(
                 }
             )
         
+        # The OTP must still be valid when the new password is submitted
+        stored_data = password_reset_data.get(email)
+        if not stored_data or not otp or not _check_reset_otp(email, stored_data, otp):
+            return templates.TemplateResponse(
+                "forgot_password.html",
+                {
+                    "request": request,
+                    "email": email,
+                    "show_otp": True,
+                    "error": "Invalid request. Please start over."
+                }
+            )
+        
         # Find user by email
-        user = db.query(auth_service.Employee).filter(auth_service.Employee.mail == email).first()
+        user = await db.scalar(select(Employee).where(Employee.mail == email))
         if not user:
             return templates.TemplateResponse(
                 "forgot_password.html",
@@ -242,8 +346,8 @@ async def handle_password_reset(
             )
         
         # Update password
-        user.password_hash = auth_service.get_password_hash(new_password)
-        db.commit()
+        user.password_hash = await auth_service.get_password_hash_async(new_password)
+        await db.commit()
         
         # Clear reset data
         if email in password_reset_data:
@@ -275,4 +379,15 @@ app.include_router(timesheets.router, dependencies=[Depends(auth_service.get_cur
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, port=8000)
\ No newline at end of file
+    # Single worker by default: temp tokens and password reset OTPs are still
+    # held in process memory, so a login or reset that lands on another worker
+    # would fail. Only raise WORKERS once those stores are shared.
+    # "auto" picks uvloop/httptools whenever they are installed.
+    uvicorn.run(
+        "main:app",
+        port=8000,
+        workers=int(os.getenv("WORKERS", "1")),
+        loop="auto",
+        http="auto",
+        access_log=False
+    )
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Float, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -20,6 +20,10 @@ class Employee(Base):
 
 class Leave(Base):
     __tablename__ = "leaves"
+    # Leading empid column also serves plain empid lookups
+    __table_args__ = (
+        Index("ix_leaves_emp_status_start", "empid", "status", "start_date"),
+    )
     
     leave_id = Column(Integer, primary_key=True, index=True)
     empid = Column(Integer, ForeignKey("employees.empid"), nullable=False)
@@ -27,11 +31,20 @@ class Leave(Base):
     end_date = Column(Date, nullable=False)
     leave_type = Column(String(20), nullable=False)
     status = Column(String(20), default='pending')
+    # Added after the initial schema; existing databases need the ALTER TABLEs in README.md
+    reason = Column(String)
+    created_at = Column(DateTime, server_default=func.now())
     
     employee = relationship("Employee", back_populates="leaves")
 
 class Timesheet(Base):
     __tablename__ = "timesheets"
+    # Match the list filters and the keyset ORDER BY entry_date DESC, timesheet_id DESC
+    # (index scanned backwards, so the seek needs no sort)
+    __table_args__ = (
+        Index("ix_timesheets_emp_date", "empid", "entry_date", "timesheet_id"),
+        Index("ix_timesheets_project_date", "project_code", "entry_date", "timesheet_id"),
+    )
     
     timesheet_id = Column(Integer, primary_key=True, index=True)
     empid = Column(Integer, ForeignKey("employees.empid"), nullable=False)
@@ -39,5 +52,7 @@ class Timesheet(Base):
     hours_worked = Column(Float, nullable=False)
     task_description = Column(String)
     project_code = Column(String(20))
+    # Added after the initial schema; see README.md
+    submitted_at = Column(DateTime, server_default=func.now())
     
     employee = relationship("Employee", back_populates="timesheets")
\ No newline at end of file
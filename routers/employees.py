@@ -1,116 +1,176 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 from database import get_db
-from schemas import Employee, EmployeeCreate, EmployeeUpdate
+from schemas import Employee, EmployeeCreate, EmployeeUpdate, PaginatedResponse
 from model import Employee as DBEmployee
 from auth import auth_service, TokenData
-from typing import List
+from cache import EMPLOYEE_CACHE_NAMESPACE, cache_get, cache_set, cache_clear
+from typing import Optional
+
+EMPLOYEE_CACHE_TTL = 300  # seconds
 
 router = APIRouter(
     prefix="/employees",
-    tags=["employees"],
-    dependencies=[Depends(auth_service.get_current_user)]
+    tags=["employees"]
 )
 
 @router.post("/", response_model=Employee, status_code=status.HTTP_201_CREATED)
-def create_employee(
+async def create_employee(
     employee: EmployeeCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.require_role("admin"))
 ):
-    # Check if username already exists
-    existing_user = db.query(DBEmployee).filter(
-        DBEmployee.username == employee.username
-    ).first()
-    if existing_user:
+    # Check if username already exists; SELECT 1 so no Employee row is hydrated,
+    # and done before hashing so duplicates never pay for bcrypt
+    username_taken = await db.scalar(
+        select(literal(1)).where(DBEmployee.username == employee.username).limit(1)
+    )
+    if username_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already exists"
         )
     
     # Hash password
-    hashed_password = auth_service.get_password_hash(employee.password)
+    hashed_password = await auth_service.get_password_hash_async(employee.password)
     
-    # Create new employee
-    db_employee = DBEmployee(
-        firstname=employee.firstname,
-        lastname=employee.lastname,
-        mail=employee.mail,
-        username=employee.username,
-        password_hash=hashed_password,
-        role=employee.role,
-        is_active=True,
-        leaves_available=employee.leaves_available if employee.leaves_available else 0
+    # Create new employee; RETURNING hands back the generated empid
+    db_employee = await db.scalar(
+        insert(DBEmployee)
+        .values(
+            firstname=employee.firstname,
+            lastname=employee.lastname,
+            mail=employee.mail,
+            username=employee.username,
+            password_hash=hashed_password,
+            role=employee.role,
+            is_active=True,
+            leaves_available=employee.leaves_available
+        )
+        .returning(DBEmployee)
     )
-    
-    db.add(db_employee)
-    db.commit()
-    db.refresh(db_employee)
+    await db.commit()
+    await cache_clear(EMPLOYEE_CACHE_NAMESPACE)
     return db_employee
 
-@router.get("/", response_model=List[Employee])
-def get_employees(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+@router.get("/", response_model=PaginatedResponse[Employee])
+async def get_employees(
+    after_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.require_role("hr"))
 ):
-    return db.query(DBEmployee).offset(skip).limit(limit).all()
+    cache_key = f"{EMPLOYEE_CACHE_NAMESPACE}:list:{after_id}:{limit}"
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+    
+    # Only the columns in the response model; password_hash is never sent over the wire
+    query = select(DBEmployee).options(
+        load_only(
+            DBEmployee.empid,
+            DBEmployee.firstname,
+            DBEmployee.lastname,
+            DBEmployee.mail,
+            DBEmployee.username,
+            DBEmployee.role,
+            DBEmployee.is_active,
+            DBEmployee.leaves_available,
+            raiseload=True
+        )
+    )
+    # Keyset pagination: seek past the last empid instead of scanning an OFFSET
+    if after_id is not None:
+        query = query.where(DBEmployee.empid > after_id)
+    db_employees = (await db.scalars(query.order_by(DBEmployee.empid).limit(limit))).all()
+    
+    next_cursor = None
+    if len(db_employees) == limit:
+        next_cursor = {"after_id": db_employees[-1].empid}
+    page = PaginatedResponse[Employee](
+        items=[Employee.model_validate(e) for e in db_employees],
+        page_size=limit,
+        next_cursor=next_cursor
+    ).model_dump(mode="json")
+    await cache_set(cache_key, page, EMPLOYEE_CACHE_TTL)
+    return page
 
 @router.get("/{empid}", response_model=Employee)
-def get_employee(
+async def get_employee(
     empid: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.get_current_user)
 ):
-    db_employee = db.query(employee).filter(DBEmployee.empid == empid).first()
-    if not db_employee:
-        raise HTTPException(status_code=404, detail="Employee not found")
-    
     # Employees can only view their own profile unless HR or admin
+    # (checked first so cached profiles are never served to the wrong user)
     if current_user.role not in ["hr", "admin"] and current_user.empid != empid:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You can only view your own profile"
         )
     
-    return db_employee
+    cache_key = f"{EMPLOYEE_CACHE_NAMESPACE}:{empid}"
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+    
+    db_employee = await db.get(DBEmployee, empid)
+    if not db_employee:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    
+    employee = Employee.model_validate(db_employee).model_dump(mode="json")
+    await cache_set(cache_key, employee, EMPLOYEE_CACHE_TTL)
+    return employee
 
 @router.put("/{empid}", response_model=Employee)
-def update_employee(
+async def update_employee(
     empid: int,
     employee: EmployeeUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.require_role("hr"))
 ):
-    db_employee = db.query(DBEmployee).filter(DBEmployee.empid == empid).first()
+    # Only the fields the client actually sent; nulls never overwrite a column
+    update_data = employee.model_dump(exclude_unset=True, exclude_none=True)
+    
+    # Hash new password if provided; bcrypt is skipped entirely for empty values
+    password = update_data.pop("password", None)
+    if password:
+        update_data["password_hash"] = await auth_service.get_password_hash_async(password)
+    
+    if not update_data:
+        db_employee = await db.get(DBEmployee, empid)
+        if not db_employee:
+            raise HTTPException(status_code=404, detail="Employee not found")
+        return db_employee
+    
+    # Single UPDATE of just the changed columns, row handed back by RETURNING
+    db_employee = await db.scalar(
+        update(DBEmployee)
+        .where(DBEmployee.empid == empid)
+        .values(**update_data)
+        .returning(DBEmployee)
+    )
     if not db_employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    # Update fields
-    update_data = employee.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        if key == "password":
-            # Hash new password if provided
-            setattr(db_employee, "password_hash", auth_service.get_password_hash(value))
-        else:
-            setattr(db_employee, key, value)
-    
-    db.commit()
-    db.refresh(db_employee)
+    await db.commit()
+    await cache_clear(EMPLOYEE_CACHE_NAMESPACE)
     return db_employee
 
 @router.delete("/{empid}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_employee(
+async def delete_employee(
     empid: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.require_role("admin"))
 ):
-    db_employee = db.query(DBEmployee).filter(DBEmployee.empid == empid).first()
+    db_employee = await db.get(DBEmployee, empid)
     if not db_employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
     # Soft delete (deactivate) instead of permanent delete
     db_employee.is_active = False
-    db.commit()
+    await db.commit()
+    await cache_clear(EMPLOYEE_CACHE_NAMESPACE)
     return
\ No newline at end of file
@@ -1,30 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from schemas import Leave, LeaveCreate
+from schemas import Leave, LeaveCreate, PaginatedResponse
 from model import Leave as DBLeave, Employee
 from auth import  TokenData
 from datetime import date
-from typing import List
+from typing import Optional
 from auth import auth_service, TokenData
+from cache import EMPLOYEE_CACHE_NAMESPACE, cache_clear
 
 router = APIRouter(
     prefix="/leaves",
-    tags=["leaves"],
-    dependencies=[Depends(auth_service.get_current_user)]
+    tags=["leaves"]
 )
 
 @router.post("/", response_model=Leave, status_code=status.HTTP_201_CREATED)
-def create_leave(
+async def create_leave(
     leave: LeaveCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.get_current_user)
 ):
     # Calculate leave duration
     duration = (leave.end_date - leave.start_date).days + 1
     
-    # Get employee
-    db_employee = db.query(Employee).filter(Employee.empid == current_user.empid).first()
+    # Get employee; approve_leave re-checks the balance in its guarded UPDATE
+    db_employee = await db.get(Employee, current_user.empid)
     if not db_employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
@@ -35,101 +36,123 @@ def create_leave(
             detail=f"Insufficient leave balance. Available: {db_employee.leaves_available}, Requested: {duration}"
         )
     
-    # Create new leave request
-    db_leave = DBLeave(
-        empid=current_user.empid,
-        start_date=leave.start_date,
-        end_date=leave.end_date,
-        leave_type=leave.leave_type,
-        status="pending"
+    # Create new leave request; RETURNING hands back the generated id and created_at
+    db_leave = await db.scalar(
+        insert(DBLeave)
+        .values(
+            empid=current_user.empid,
+            start_date=leave.start_date,
+            end_date=leave.end_date,
+            leave_type=leave.leave_type,
+            reason=leave.reason,
+            status="pending"
+        )
+        .returning(DBLeave)
     )
-    
-    db.add(db_leave)
-    db.commit()
-    db.refresh(db_leave)
+    await db.commit()
     return db_leave
 
-@router.get("/", response_model=List[Leave])
-def get_leaves(
+@router.get("/", response_model=PaginatedResponse[Leave])
+async def get_leaves(
     status: str = None,
     start_date: date = None,
     end_date: date = None,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    after_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.get_current_user)
 ):
-    query = db.query(DBLeave)
+    query = select(DBLeave)
     
     # Filter based on user role
     if current_user.role not in ["hr", "admin"]:
-        query = query.filter(DBLeave.empid == current_user.empid)
+        query = query.where(DBLeave.empid == current_user.empid)
     
     # Apply filters
     if status:
-        query = query.filter(DBLeave.status == status)
+        query = query.where(DBLeave.status == status)
     if start_date:
-        query = query.filter(DBLeave.start_date >= start_date)
+        query = query.where(DBLeave.start_date >= start_date)
     if end_date:
-        query = query.filter(DBLeave.end_date <= end_date)
+        query = query.where(DBLeave.end_date <= end_date)
     
-    return query.offset(skip).limit(limit).all()
+    # Keyset pagination on leave_id
+    if after_id is not None:
+        query = query.where(DBLeave.leave_id > after_id)
+    leaves = (await db.scalars(query.order_by(DBLeave.leave_id).limit(limit))).all()
+    
+    next_cursor = None
+    if len(leaves) == limit:
+        next_cursor = {"after_id": leaves[-1].leave_id}
+    return PaginatedResponse[Leave](
+        items=[Leave.model_validate(leave) for leave in leaves],
+        page_size=limit,
+        next_cursor=next_cursor
+    )
 
 @router.put("/{leave_id}/approve", response_model=Leave)
-def approve_leave(
+async def approve_leave(
     leave_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.require_role("hr"))
 ):
-    db_leave = db.query(DBLeave).filter(DBLeave.leave_id == leave_id).first()
+    # Claim the leave only if it is still pending; no SELECT beforehand
+    db_leave = await db.scalar(
+        update(DBLeave)
+        .where(DBLeave.leave_id == leave_id, DBLeave.status == "pending")
+        .values(status="approved")
+        .returning(DBLeave)
+    )
     if not db_leave:
-        raise HTTPException(status_code=404, detail="Leave request not found")
-    
-    if db_leave.status != "pending":
+        # Failure path only: tell a missing leave apart from an already-decided one
+        if await db.scalar(select(DBLeave.leave_id).where(DBLeave.leave_id == leave_id)) is None:
+            raise HTTPException(status_code=404, detail="Leave request not found")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Only pending leave requests can be approved"
         )
     
-    # Get employee
-    db_employee = db.query(Employee).filter(Employee.empid == db_leave.empid).first()
-    if not db_employee:
-        raise HTTPException(status_code=404, detail="Employee not found")
-    
     # Calculate leave duration
     duration = (db_leave.end_date - db_leave.start_date).days + 1
     
-    # Deduct from leave balance
-    if db_employee.leaves_available < duration:
+    # Deduct from leave balance atomically; the WHERE guards against overdrawing
+    remaining = await db.scalar(
+        update(Employee)
+        .where(Employee.empid == db_leave.empid, Employee.leaves_available >= duration)
+        .values(leaves_available=Employee.leaves_available - duration)
+        .returning(Employee.leaves_available)
+    )
+    if remaining is None:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Employee doesn't have sufficient leave balance"
         )
     
-    db_employee.leaves_available -= duration
-    db_leave.status = "approved"
-    
-    db.commit()
-    db.refresh(db_leave)
+    await db.commit()
+    # The employee's cached leaves_available is now stale
+    await cache_clear(EMPLOYEE_CACHE_NAMESPACE)
     return db_leave
 
 @router.put("/{leave_id}/reject", response_model=Leave)
-def reject_leave(
+async def reject_leave(
     leave_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.require_role("hr"))
 ):
-    db_leave = db.query(DBLeave).filter(DBLeave.leave_id == leave_id).first()
+    db_leave = await db.scalar(
+        update(DBLeave)
+        .where(DBLeave.leave_id == leave_id, DBLeave.status == "pending")
+        .values(status="rejected")
+        .returning(DBLeave)
+    )
     if not db_leave:
-        raise HTTPException(status_code=404, detail="Leave request not found")
-    
-    if db_leave.status != "pending":
+        if await db.scalar(select(DBLeave.leave_id).where(DBLeave.leave_id == leave_id)) is None:
+            raise HTTPException(status_code=404, detail="Leave request not found")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Only pending leave requests can be rejected"
         )
     
-    db_leave.status = "rejected"
-    db.commit()
-    db.refresh(db_leave)
+    await db.commit()
     return db_leave
\ No newline at end of file
@@ -1,106 +1,171 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from schemas import Timesheet, TimesheetCreate
+from schemas import Timesheet, TimesheetCreate, PaginatedResponse
 from model import Timesheet as DBTimesheet
 from auth import auth_service,TokenData
 from datetime import date
-from typing import List
-from dependencies import get_current_user
+from typing import List, Optional
+
+BULK_TIMESHEET_LIMIT = 500  # entries per POST /timesheets/bulk
 
 router = APIRouter(
     prefix="/timesheets",
-    tags=["timesheets"],
-    dependencies=[Depends(get_current_user)]
+    tags=["timesheets"]
 )
 
+def _validate_hours(hours_worked: float, prefix: str = ""):
+    """Reject hours outside a single day with 400"""
+    if hours_worked < 0 or hours_worked > 24:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{prefix}Hours worked must be between 0 and 24"
+        )
+
 @router.post("/", response_model=Timesheet, status_code=status.HTTP_201_CREATED)
-def create_timesheet(
+async def create_timesheet(
     timesheet: TimesheetCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.get_current_user)
 ):
     # Validate hours
-    if timesheet.hours_worked < 0 or timesheet.hours_worked > 24:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Hours worked must be between 0 and 24"
-        )
+    _validate_hours(timesheet.hours_worked)
     
-    # Create new timesheet entry
-    db_timesheet = DBTimesheet(
-        empid=current_user.empid,
-        entry_date=timesheet.entry_date,
-        hours_worked=timesheet.hours_worked,
-        task_description=timesheet.task_description,
-        project_code=timesheet.project_code
+    # Create new timesheet entry; RETURNING hands back the generated id and submitted_at
+    db_timesheet = await db.scalar(
+        insert(DBTimesheet)
+        .values(
+            empid=current_user.empid,
+            entry_date=timesheet.entry_date,
+            hours_worked=timesheet.hours_worked,
+            task_description=timesheet.task_description,
+            project_code=timesheet.project_code
+        )
+        .returning(DBTimesheet)
     )
-    
-    db.add(db_timesheet)
-    db.commit()
-    db.refresh(db_timesheet)
+    await db.commit()
     return db_timesheet
 
-@router.get("/", response_model=List[Timesheet])
-def get_timesheets(
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def create_timesheets_bulk(
+    timesheets: List[TimesheetCreate] = Body(..., max_length=BULK_TIMESHEET_LIMIT),
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(auth_service.get_current_user)
+):
+    # Validate every entry before writing anything
+    for i, timesheet in enumerate(timesheets):
+        _validate_hours(timesheet.hours_worked, f"Entry {i}: ")
+    
+    rows = [
+        {
+            "empid": current_user.empid,
+            "entry_date": timesheet.entry_date,
+            "hours_worked": timesheet.hours_worked,
+            "task_description": timesheet.task_description,
+            "project_code": timesheet.project_code
+        }
+        for timesheet in timesheets
+    ]
+    if rows:
+        # One executemany batch and a single commit for the whole list
+        await db.execute(insert(DBTimesheet), rows)
+        await db.commit()
+    return {"inserted": len(rows)}
+
+@router.get("/", response_model=PaginatedResponse[Timesheet])
+async def get_timesheets(
     start_date: date = None,
     end_date: date = None,
     project_code: str = None,
-    skip: int = 0,
-    limit: int = 9,
-    db: Session = Depends(get_db),
+    after_date: Optional[date] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(9, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
     current_user:TokenData = Depends(auth_service.get_current_user)
 ):
-    query = db.query(DBTimesheet)
+    query = select(DBTimesheet)
     
     # Filter based on user role
     if current_user.role not in ["hr", "admin", "manager"]:
-        query = query.filter(DBTimesheet.empid == current_user.empid)
+        query = query.where(DBTimesheet.empid == current_user.empid)
     
     # Apply filters
     if start_date:
-        query = query.filter(DBTimesheet.entry_date >= start_date)
+        query = query.where(DBTimesheet.entry_date >= start_date)
     if end_date:
-        query = query.filter(DBTimesheet.entry_date <= end_date)
+        query = query.where(DBTimesheet.entry_date <= end_date)
     if project_code:
-        query = query.filter(DBTimesheet.project_code == project_code)
+        query = query.where(DBTimesheet.project_code == project_code)
+    
+    # The cursor is the (after_date, after_id) pair; half of it can't seek anywhere
+    if (after_date is None) != (after_id is None):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="after_date and after_id must be given together"
+        )
     
-    return query.order_by(DBTimesheet.entry_date.desc()).offset(skip).limit(limit).all()
+    # Keyset pagination: newest first, timesheet_id breaks ties within a day
+    if after_date is not None:
+        query = query.where(
+            tuple_(DBTimesheet.entry_date, DBTimesheet.timesheet_id) < (after_date, after_id)
+        )
+    query = query.order_by(
+        DBTimesheet.entry_date.desc(), DBTimesheet.timesheet_id.desc()
+    ).limit(limit)
+    timesheets = (await db.scalars(query)).all()
+    
+    next_cursor = None
+    if len(timesheets) == limit:
+        last = timesheets[-1]
+        next_cursor = {"after_date": last.entry_date.isoformat(), "after_id": last.timesheet_id}
+    return PaginatedResponse[Timesheet](
+        items=[Timesheet.model_validate(timesheet) for timesheet in timesheets],
+        page_size=limit,
+        next_cursor=next_cursor
+    )
 
 @router.get("/summary")
-def get_timesheet_summary(
+async def get_timesheet_summary(
     start_date: date,
     end_date: date,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenData = Depends(auth_service.get_current_user)
 ):
-    # Build base query
-    query = db.query(DBTimesheet)
+    # Aggregate per project in the database; Core columns only, so rows come
+    # back as plain Row tuples with no ORM hydration
+    query = select(
+        DBTimesheet.project_code,
+        func.sum(DBTimesheet.hours_worked).label("h"),
+        func.count().label("c")
+    )
     
     # Filter based on user role
     if current_user.role not in ["hr", "admin", "manager"]:
-        query = query.filter(DBTimesheet.empid == current_user.empid)
+        query = query.where(DBTimesheet.empid == current_user.empid)
     
     # Apply date filters
-    query = query.filter(DBTimesheet.entry_date >= start_date)
-    query = query.filter(DBTimesheet.entry_date <= end_date)
+    query = query.where(DBTimesheet.entry_date >= start_date)
+    query = query.where(DBTimesheet.entry_date <= end_date)
+    query = query.group_by(DBTimesheet.project_code)
     
-    # Execute query
-    entries = query.all()
+    # Stream through a server-side cursor in batches so memory stays bounded
+    # however many projects the range covers
+    rows = await db.stream(query.execution_options(yield_per=1000))
     
-    # Calculate summary
-    total_hours = sum(entry.hours_worked for entry in entries)
+    # Calculate summary in a single pass over the grouped rows
     project_summary = {}
-    
-    for entry in entries:
-        if entry.project_code not in project_summary:
-            project_summary[entry.project_code] = 0
-        project_summary[entry.project_code] += entry.hours_worked
+    total_hours = 0
+    total_entries = 0
+    async for row in rows:
+        project_summary[row.project_code] = row.h
+        total_hours += row.h
+        total_entries += row.c
     
     return {
         "start_date": start_date,
         "end_date": end_date,
-        "total_entries": len(entries),
+        "total_entries": total_entries,
         "total_hours": total_hours,
         "project_summary": project_summary
     }
\ No newline at end of file
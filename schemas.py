@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from datetime import date, datetime
-from typing import Optional, List
+from functools import cached_property
+from typing import Generic, List, Optional, TypeVar
 
 class TempToken(BaseModel):
     temp_token: str
@@ -24,6 +25,11 @@ class TokenData(BaseModel):
     role: str
     empid: int
 
+    @cached_property
+    def _payload_base(self) -> dict:
+        """Invariant JWT claims, built once per instance without model_dump"""
+        return {"sub": self.username, "role": self.role, "empid": self.empid}
+
 class EmployeeBase(BaseModel):
     firstname: str
     lastname: str
@@ -33,14 +39,14 @@ class EmployeeBase(BaseModel):
 
 class EmployeeCreate(EmployeeBase):
     password: str
+    leaves_available: int = 0
 
 class Employee(EmployeeBase):
     empid: int
     is_active: bool
     leaves_available: int
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
 
 class EmployeeUpdate(BaseModel):
     firstname: Optional[str] = None
@@ -50,6 +56,7 @@ class EmployeeUpdate(BaseModel):
     role: Optional[str] = None
     is_active: Optional[bool] = None
     leaves_available: Optional[int] = None
+    password: Optional[str] = None
 
 class LeaveBase(BaseModel):
     start_date: date
@@ -66,8 +73,7 @@ class Leave(LeaveBase):
     status: str = "pending"
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
 
 class LeaveUpdate(BaseModel):
     start_date: Optional[date] = None
@@ -90,8 +96,7 @@ class Timesheet(TimesheetBase):
     empid: int
     submitted_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
 
 class TimesheetUpdate(BaseModel):
     entry_date: Optional[date] = None
@@ -118,8 +123,7 @@ class AuditLog(BaseModel):
     details: str
     timestamp: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
 
 class PasswordResetRequest(BaseModel):
     email: EmailStr
@@ -136,15 +140,17 @@ class UserActivity(BaseModel):
 class ErrorResponse(BaseModel):
     detail: str
     code: int
-    timestamp: datetime = datetime.now()
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 class SuccessResponse(BaseModel):
     message: str
     data: Optional[dict] = None
-    timestamp: datetime = datetime.now()
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+T = TypeVar("T")
 
-class PaginatedResponse(BaseModel):
-    items: List
-    total: int
-    page: int
-    page_size: int
\ No newline at end of file
+class PaginatedResponse(BaseModel, Generic[T]):
+    """Keyset-paginated page; pass next_cursor back as query params for the next page"""
+    items: List[T]
+    page_size: int
+    next_cursor: Optional[dict] = None
\ No newline at end of file